@@ -1,27 +1,64 @@
+import bisect
 import threading
-from datetime import datetime, timedelta
-from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Tuple
-from collections import defaultdict
+from typing import List, Optional, Dict
 
-from utils import FileMetadata
+from utils import FileMetadata, TagIndex
+
+def _even_chunks(items, max_size):
+    """Split items into the fewest chunks of at most max_size, sized evenly"""
+    count = -(-len(items) // max_size)
+    start = 0
+    for i in range(count):
+        end = start + (len(items) - start) // (count - i)
+        yield items[start:end]
+        start = end
 
 class BPlusNode:
     """Node in a B+ tree"""
+    __slots__ = ('order', 'keys', 'children', 'keys_fn', 'values', 'is_leaf',
+                 'next', 'high_key', 'version', 'latch')
+    
     def __init__(self, order, is_leaf=False):
         self.order = order  # Maximum number of children
-        self.keys = []  # List of keys (FileMetadata for leaf, filenames for internal)
+        self.keys = []  # Separator keys (internal nodes only)
         self.children = []  # Child nodes (for internal) or None (for leaf)
+        if is_leaf:
+            self.keys_fn = []  # Sorted filename keys
+            self.values = []  # FileMetadata, parallel to keys_fn
         self.is_leaf = is_leaf
-        self.next = None  # Pointer to next leaf (for range queries)
-        self.parent = None
+        # B-link: right sibling on the same level (leaf chain for range
+        # queries) and an exclusive upper bound on keys (None = unbounded)
+        self.next = None
+        self.high_key = None
+        
+        # Optimistic concurrency: even version = unlocked, odd = being written
+        self.version = 0
+        self.latch = threading.Lock()
+    
+    def write_lock(self):
+        self.latch.acquire()
+        self.version += 1
+    
+    def write_unlock(self):
+        self.version += 1
+        self.latch.release()
+    
+    def stable_version(self):
+        """Return the node version, waiting out any writer holding the latch"""
+        version = self.version
+        while version & 1:
+            with self.latch:
+                pass
+            version = self.version
+        return version
     
     def is_full(self):
-        return len(self.keys) >= self.order - 1
+        keys = self.keys_fn if self.is_leaf else self.keys
+        return len(keys) >= self.order - 1
     
     def __repr__(self):
         if self.is_leaf:
-            return f"Leaf({len(self.keys)} keys)"
+            return f"Leaf({len(self.keys_fn)} keys)"
         return f"Internal({len(self.keys)} keys, {len(self.children)} children)"
 
 
@@ -29,116 +66,195 @@ class BPlusTree:
     """
     B+ Tree implementation for metadata indexing.
     All data stored in leaves, internal nodes only store keys for navigation.
+    Nodes form a B-link tree: a search that lands on a node split under it
+    follows the right link, so no parent pointers are needed. Readers
+    traverse without locks and validate node versions; writers latch one
+    node at a time, taking the tree lock only to split nodes.
     """
     def __init__(self, order=100):
         self.order = order  # Typical B+ tree order (fanout)
         self.root = BPlusNode(order, is_leaf=True)
-        self.lock = threading.RLock()
+        self.lock = threading.Lock()  # Serializes structure modifications (splits)
         self.size = 0
+        self.size_lock = threading.Lock()
+        
+        # Filenames are stored in nodes as interned UTF-8 bytes: one shared
+        # object per name, compared with memcmp (byte order == str order)
+        self._intern: Dict[str, bytes] = {}
         self.height = 1
         
         # Secondary indices
-        self.tag_index = defaultdict(list)
-        self.tag_lock = threading.RLock()
+        self.tags = TagIndex()
     
     def insert(self, metadata: FileMetadata):
         """Insert metadata (thread-safe)"""
+        self._insert_entry(metadata)
+        
+        # Update tag index
+        self.tags.add(metadata)
+    
+    def _insert_entry(self, metadata):
+        """Insert metadata into the tree only (no tag index update)"""
+        key = self._intern_key(metadata.filename)
+        while True:
+            leaf, version = self._find_leaf_optimistic(key)
+            with leaf.latch:
+                if leaf.version != version:
+                    continue  # Leaf changed since we reached it, retry
+                
+                # Fast path: the leaf has room, so only the leaf is modified
+                i = bisect.bisect_left(leaf.keys_fn, key)
+                exists = i < len(leaf.keys_fn) and leaf.keys_fn[i] == key
+                if exists or len(leaf.keys_fn) + 1 < self.order:
+                    leaf.version += 1
+                    is_new = self._insert_into_leaf(leaf, key, metadata)
+                    leaf.version += 1
+                    break
+            
+            # Leaf is full: split under the tree lock
+            is_new = self._insert_with_split(key, metadata)
+            break
+        
+        if is_new:
+            with self.size_lock:
+                self.size += 1
+    
+    def _intern_key(self, filename):
+        """Return the shared bytes key for filename, creating it if needed"""
+        key = self._intern.get(filename)
+        if key is None:
+            key = self._intern.setdefault(filename, filename.encode('utf-8'))
+        return key
+    
+    def _insert_with_split(self, key, metadata):
+        """Insert into a full leaf and propagate the split up the descent path"""
         with self.lock:
-            # Find leaf node
-            leaf = self._find_leaf(self.root, metadata.filename)
+            # Nodes only split under self.lock, so this walk is stable
+            path = []
+            leaf = self._find_leaf(self.root, key, path)
             
-            # Insert into leaf
-            self._insert_into_leaf(leaf, metadata)
+            leaf.write_lock()
+            try:
+                is_new = self._insert_into_leaf(leaf, key, metadata)
+                split = None
+                if len(leaf.keys_fn) >= self.order:
+                    split = self._split_leaf(leaf)
+            finally:
+                leaf.write_unlock()
             
-            # Check if split needed
-            if len(leaf.keys) >= self.order:
-                self._split_leaf(leaf)
+            if split is not None:
+                self._insert_into_parent(path, leaf, *split)
+            return is_new
+    
+    def _find_leaf(self, node, key, path=None):
+        """Find the leaf node where key should be inserted, recording internal nodes in path"""
+        # Binary search each internal node for the child covering key.
+        # Keys stay a plain sorted list: the list already holds contiguous
+        # pointers, and an Eytzinger/blocked walk in Python is ~4x slower
+        # than bisect's C loop at these node sizes.
+        while not node.is_leaf:
+            if path is not None:
+                path.append(node)
+            node = node.children[bisect.bisect_right(node.keys, key)]
+        return node
+    
+    def _find_leaf_optimistic(self, key):
+        """Find the leaf for key without locks, returning (leaf, version)"""
+        while True:
+            found = self._try_find_leaf(key)
+            if found is not None:
+                return found
+    
+    def _try_find_leaf(self, key):
+        """One lock-free descent; returns None if a concurrent write interfered"""
+        node = self.root
+        version = node.stable_version()
+        
+        while True:
+            # Node split after we chose it: its upper half is to the right
+            high_key, right = node.high_key, node.next
+            if high_key is not None and key >= high_key:
+                if node.version != version:
+                    return None
+                node = right
+                version = node.stable_version()
+                continue
             
-            self.size += 1
+            if node.is_leaf:
+                return node, version
             
-            # Update tag index
-            with self.tag_lock:
-                for tag in metadata.tags:
-                    self.tag_index[tag].append(metadata)
-    
-    def _find_leaf(self, node, filename):
-        """Find the leaf node where key should be inserted"""
-        if node.is_leaf:
-            return node
-        
-        # Find appropriate child
-        for i, key in enumerate(node.keys):
-            if filename < key:
-                return self._find_leaf(node.children[i], filename)
-        
-        return self._find_leaf(node.children[-1], filename)
-    
-    def _insert_into_leaf(self, leaf, metadata):
-        """Insert metadata into leaf node in sorted order"""
-        inserted = False
-        for i, existing in enumerate(leaf.keys):
-            if metadata.filename == existing.filename:
-                # Update existing
-                leaf.keys[i] = metadata
-                return
-            if metadata.filename < existing.filename:
-                leaf.keys.insert(i, metadata)
-                inserted = True
-                break
-        
-        if not inserted:
-            leaf.keys.append(metadata)
+            try:
+                child = node.children[bisect.bisect_right(node.keys, key)]
+            except IndexError:
+                return None
+            if node.version != version:
+                return None
+            node = child
+            version = node.stable_version()
+    
+    def _insert_into_leaf(self, leaf, key, metadata):
+        """Insert metadata into leaf node in sorted order, True if new"""
+        i = bisect.bisect_left(leaf.keys_fn, key)
+        if i < len(leaf.keys_fn) and leaf.keys_fn[i] == key:
+            # Update existing
+            leaf.values[i] = metadata
+            return False
+        leaf.keys_fn.insert(i, key)
+        leaf.values.insert(i, metadata)
+        return True
     
     def _split_leaf(self, leaf):
-        """Split a full leaf node"""
-        mid = len(leaf.keys) // 2
+        """Split a full leaf node (caller holds its latch), returning (separator, new_leaf)"""
+        mid = len(leaf.keys_fn) // 2
         
         # Create new leaf
         new_leaf = BPlusNode(self.order, is_leaf=True)
-        new_leaf.keys = leaf.keys[mid:]
-        new_leaf.next = leaf.next
-        leaf.keys = leaf.keys[:mid]
-        leaf.next = new_leaf
-        
-        # Get key to push up
-        push_up_key = new_leaf.keys[0].filename
-        
-        # Insert into parent
-        if leaf.parent is None:
-            # Create new root
-            new_root = BPlusNode(self.order, is_leaf=False)
-            new_root.keys = [push_up_key]
-            new_root.children = [leaf, new_leaf]
-            leaf.parent = new_root
-            new_leaf.parent = new_root
-            self.root = new_root
-            self.height += 1
-        else:
-            self._insert_into_parent(leaf.parent, push_up_key, new_leaf)
-    
-    def _insert_into_parent(self, parent, key, new_child):
-        """Insert key and child into parent node"""
-        # Find position
-        inserted = False
-        for i, existing_key in enumerate(parent.keys):
-            if key < existing_key:
+        new_leaf.keys_fn = leaf.keys_fn[mid:]
+        new_leaf.values = leaf.values[mid:]
+        separator = new_leaf.keys_fn[0]
+        self._link_right(leaf, new_leaf, separator)
+        # Truncate in place rather than rebuilding the lists
+        del leaf.keys_fn[mid:]
+        del leaf.values[mid:]
+        
+        return separator, new_leaf
+    
+    def _link_right(self, node, new_node, separator):
+        """Make new_node the right sibling of node, covering keys >= separator"""
+        new_node.next = node.next
+        new_node.high_key = node.high_key
+        node.next = new_node
+        node.high_key = separator
+    
+    def _insert_into_parent(self, path, node, key, new_child):
+        """Insert key and node's new right sibling into the parents on path, splitting upward"""
+        while path:
+            parent = path.pop()
+            
+            parent.write_lock()
+            try:
+                # Find position
+                i = bisect.bisect_right(parent.keys, key)
                 parent.keys.insert(i, key)
                 parent.children.insert(i + 1, new_child)
-                inserted = True
-                break
-        
-        if not inserted:
-            parent.keys.append(key)
-            parent.children.append(new_child)
-        
-        new_child.parent = parent
+                
+                # Stop unless the parent overflowed too
+                if len(parent.keys) < self.order:
+                    return
+                key, new_child = self._split_internal(parent)
+            finally:
+                parent.write_unlock()
+            node = parent
         
-        # Check if parent needs splitting
-        if len(parent.keys) >= self.order:
-            self._split_internal(parent)
+        # Split reached the root: create new root
+        new_root = BPlusNode(self.order, is_leaf=False)
+        new_root.keys = [key]
+        new_root.children = [node, new_child]
+        self.root = new_root
+        self.height += 1
     
     def _split_internal(self, node):
-        """Split a full internal node"""
+        """Split a full internal node (caller holds its latch), returning (push_up_key, new_node)"""
         mid = len(node.keys) // 2
         push_up_key = node.keys[mid]
         
@@ -146,75 +262,145 @@ class BPlusTree:
         new_node = BPlusNode(self.order, is_leaf=False)
         new_node.keys = node.keys[mid + 1:]
         new_node.children = node.children[mid + 1:]
+        self._link_right(node, new_node, push_up_key)
         
-        node.keys = node.keys[:mid]
-        node.children = node.children[:mid + 1]
-        
-        # Update parent pointers
-        for child in new_node.children:
-            child.parent = new_node
-        
-        # Insert into parent
-        if node.parent is None:
-            # Create new root
-            new_root = BPlusNode(self.order, is_leaf=False)
-            new_root.keys = [push_up_key]
-            new_root.children = [node, new_node]
-            node.parent = new_root
-            new_node.parent = new_root
-            self.root = new_root
-            self.height += 1
-        else:
-            self._insert_into_parent(node.parent, push_up_key, new_node)
+        del node.keys[mid:]
+        del node.children[mid + 1:]
+        
+        return push_up_key, new_node
     
     def search_by_filename(self, filename: str) -> Optional[FileMetadata]:
-        """Search by filename"""
-        with self.lock:
-            leaf = self._find_leaf(self.root, filename)
+        """Search by filename (lock-free, retried on concurrent writes)"""
+        key = self._intern.get(filename)
+        if key is None:
+            return None  # Every stored filename is interned before insertion
+        
+        while True:
+            leaf, version = self._find_leaf_optimistic(key)
             
-            for metadata in leaf.keys:
-                if metadata.filename == filename:
-                    return metadata
-            return None
+            result = None
+            try:
+                i = bisect.bisect_left(leaf.keys_fn, key)
+                if i < len(leaf.keys_fn) and leaf.keys_fn[i] == key:
+                    result = leaf.values[i]
+            except IndexError:
+                continue
+            
+            if leaf.version == version:
+                return result
     
     def search_by_tag(self, tag: str) -> List[FileMetadata]:
         """Search by tag"""
-        with self.tag_lock:
-            return self.tag_index.get(tag, []).copy()
+        return self.tags.search(tag)
+    
+    def flush_tags(self):
+        """Merge buffered tag updates into the tag index"""
+        self.tags.flush()
     
     def list_files(self, order='asc') -> List[FileMetadata]:
         """List all files in order (efficient due to leaf linking)"""
-        with self.lock:
-            result = []
-            
-            # Find leftmost leaf
-            node = self.root
-            while not node.is_leaf:
-                node = node.children[0]
-            
-            # Traverse leaves
-            while node is not None:
-                result.extend(node.keys)
-                node = node.next
-            
-            if order == 'desc':
-                result.reverse()
+        result = []
+        last = None  # Largest key emitted so far
+        
+        # Find leftmost leaf (splits never move it)
+        node = self.root
+        while not node.is_leaf:
+            node = node.children[0]
+        
+        # Traverse leaves, re-reading any leaf modified while it was copied
+        while node is not None:
+            version = node.stable_version()
+            keys, values, next_leaf = node.keys_fn, node.values, node.next
+            # Skip entries already emitted from a leaf split behind us
+            start = 0 if last is None else bisect.bisect_right(keys, last)
+            chunk = values[start:]
+            tail = keys[-1] if keys else last
+            if node.version != version:
+                continue
             
-            return result
+            result.extend(chunk)
+            last = tail
+            node = next_leaf
+        
+        if order == 'desc':
+            result.reverse()
+        
+        return result
     
     def get_height(self):
-        with self.lock:
-            return self.height
+        return self.height
     
     def get_size(self):
-        with self.lock:
-            return self.size
+        return self.size
     
     def get_stats(self):
         """Get B+ tree statistics"""
+        return {
+            'size': self.size,
+            'height': self.height,
+            'order': self.order
+        }
+    
+    def bulk_load(self, metadata_list: List[FileMetadata]):
+        """
+        Build the tree bottom-up from metadata_list, replacing its contents.
+        Sorts once and packs leaves directly, so no splits occur. Not safe to
+        run concurrently with insert.
+        """
+        # Drop the old contents' tags and interned names along with the nodes
+        self.tags = TagIndex()
+        self._intern = {}
+        
+        # Later duplicates win, as with repeated inserts
+        by_key = {}
+        for metadata in metadata_list:
+            by_key[self._intern_key(metadata.filename)] = metadata
+        self._bulk_build([by_key[key] for key in sorted(by_key)])
+        
+        # Update tag index
+        for metadata in by_key.values():
+            self.tags.add(metadata)
+    
+    def _bulk_build(self, entries):
+        """Rebuild the tree from entries sorted by filename without duplicates"""
         with self.lock:
-            return {
-                'size': self.size,
-                'height': self.height,
-                'order': self.order
-            }
+            # Pack leaves
+            level = []  # (smallest key in subtree, node)
+            for chunk in _even_chunks(entries, self.order - 1):
+                leaf = BPlusNode(self.order, is_leaf=True)
+                leaf.keys_fn = [self._intern_key(metadata.filename) for metadata in chunk]
+                leaf.values = chunk
+                level.append((leaf.keys_fn[0], leaf))
+            
+            # Stack internal levels until a single root remains
+            height = 1
+            while len(level) > 1:
+                self._link_level(level)
+                parents = []
+                for group in _even_chunks(level, self.order):
+                    node = BPlusNode(self.order, is_leaf=False)
+                    node.keys = [key for key, _ in group[1:]]
+                    node.children = [child for _, child in group]
+                    parents.append((group[0][0], node))
+                level = parents
+                height += 1
+            
+            self.root = level[0][1] if level else BPlusNode(self.order, is_leaf=True)
+            self.height = height
+            with self.size_lock:
+                self.size = len(entries)
+    
+    def _link_level(self, level):
+        """Chain (smallest key, node) pairs left to right with right links and high keys"""
+        for (_, node), (next_key, next_node) in zip(level, level[1:]):
+            node.next = next_node
+            node.high_key = next_key
+    
+    def __getstate__(self):
+        """Pickle as the ordered entries; nodes, latches and locks are rebuilt"""
+        return {'order': self.order, 'entries': self.list_files(), 'tags': self.tags}
+    
+    def __setstate__(self, state):
+        self.__init__(state['order'])
+        self._bulk_build(state['entries'])
+        self.tags = state['tags']
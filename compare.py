@@ -1,23 +1,51 @@
 import threading
 import random
 import time
-from datetime import datetime, timedelta
-from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Tuple
-from collections import defaultdict
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+import gc
+import multiprocessing
 import sys
 
 from hashmap import HashTableIndex
-from utils import FileMetadata, MetadataGenerator
+from utils import MetadataGenerator, ShardedIndex, build_shard
 from bPlusTree import BPlusTree
 
+# Shared runtime objects reachable from a structure that are not its memory
+_SIZE_EXCLUDED_TYPES = (type, ModuleType, FunctionType, MethodType,
+                        BuiltinFunctionType, threading.Thread)
+
+def deep_size(obj):
+    """
+    Total sys.getsizeof of obj and everything reachable from it, counted once.
+    Walks the referents depth-first with an explicit stack.
+    """
+    seen = set()
+    pending = [obj]
+    total = 0
+    while pending:
+        current = pending.pop()
+        if id(current) in seen or isinstance(current, _SIZE_EXCLUDED_TYPES):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        pending.extend(gc.get_referents(current))
+    return total
+
+
 class PerformanceComparator:
     """Compare performance of different indexing structures"""
     
-    def __init__(self, num_entries=10000, num_threads=5):
+    def __init__(self, num_entries=10000, num_threads=5, use_processes=False, bulk=False, seed=None):
         self.num_entries = num_entries
         self.num_threads = num_threads
-        self.metadata_list = MetadataGenerator.generate_metadata(num_entries)
+        self.rng = random.Random(seed)  # Dataset and search sampling; pass a seed for reproducible runs
+        # Build hash-partitioned shards in worker processes. Shards are pickled
+        # back and rebuilt in this process, so height, memory and search
+        # figures then describe the rebuilt shards, not trees grown by insert
+        self.use_processes = use_processes
+        self.bulk = bulk  # Populate via bulk_load where the structure supports it
+        self.metadata_list = MetadataGenerator.generate_metadata(num_entries, self.rng)
+        self._all_filenames = [m.filename for m in self.metadata_list]
         self.results = {}
     
     def benchmark_structure(self, structure, name):
@@ -27,7 +55,7 @@ class PerformanceComparator:
         print(f"{'='*60}")
         
         metrics = {
-            'insert_times': [],
+            'insert_batches': [None] * self.num_threads,  # (count, duration) per worker
             'search_times': [],
             'list_times': [],
             'memory_estimate': 0
@@ -35,40 +63,24 @@ class PerformanceComparator:
         
         # Insertion benchmark
         print(f"[1/3] Testing insertions...")
-        chunk_size = len(self.metadata_list) // self.num_threads
-        threads = []
-        
-        start_time = time.perf_counter()
-        for i in range(self.num_threads):
-            start_idx = i * chunk_size
-            end_idx = start_idx + chunk_size if i < self.num_threads - 1 else len(self.metadata_list)
-            chunk = self.metadata_list[start_idx:end_idx]
-            
-            t = threading.Thread(
-                target=self._insert_worker,
-                args=(structure, chunk, metrics)
-            )
-            threads.append(t)
-            t.start()
-        
-        for t in threads:
-            t.join()
-        
-        insert_duration = time.perf_counter() - start_time
+        process_overhead = 0
+        if self.use_processes:
+            structure, insert_duration, process_overhead = self._insert_processes(structure, metrics['insert_batches'])
+        elif self.bulk and hasattr(structure, 'bulk_load'):
+            insert_duration = self._insert_bulk(structure, metrics['insert_batches'])
+        else:
+            insert_duration = self._insert_threads(structure, metrics['insert_batches'])
         
         # Search benchmark
         print(f"[2/3] Testing searches...")
-        search_filenames = random.sample([m.filename for m in self.metadata_list], 
-                                        k=min(1000, len(self.metadata_list)))
+        search_filenames = self.rng.sample(self._all_filenames, k=min(1000, len(self._all_filenames)))
         
         start_time = time.perf_counter()
         for filename in search_filenames:
-            search_start = time.perf_counter()
             result = structure.search_by_filename(filename)
-            search_end = time.perf_counter()
-            metrics['search_times'].append(search_end - search_start)
         
         search_duration = time.perf_counter() - start_time
+        metrics['search_times'].append(search_duration / len(search_filenames))
         
         # List benchmark
         print(f"[3/3] Testing list operation...")
@@ -77,16 +89,19 @@ class PerformanceComparator:
         list_end = time.perf_counter()
         metrics['list_times'].append(list_end - list_start)
         
-        # Memory estimate (rough)
-        metrics['memory_estimate'] = sys.getsizeof(structure)
+        # Memory estimate (structure plus everything it references)
+        metrics['memory_estimate'] = deep_size(structure)
         
         # Compile results
+        insert_count = sum(count for count, _ in metrics['insert_batches'])
+        insert_busy = sum(duration for _, duration in metrics['insert_batches'])
         result = {
             'name': name,
             'total_insert_time': insert_duration,
-            'avg_insert_time': sum(metrics['insert_times']) / len(metrics['insert_times']) if metrics['insert_times'] else 0,
+            'process_overhead': process_overhead,
+            'avg_insert_time': insert_busy / insert_count if insert_count else 0,
             'total_search_time': search_duration,
-            'avg_search_time': sum(metrics['search_times']) / len(metrics['search_times']),
+            'avg_search_time': metrics['search_times'][0],
             'list_time': metrics['list_times'][0],
             'memory_estimate': metrics['memory_estimate'],
             'size': structure.get_size()
@@ -106,20 +121,72 @@ class PerformanceComparator:
         
         return result
     
-    def _insert_worker(self, structure, metadata_list, metrics):
-        """Worker for inserting metadata"""
+    def _insert_threads(self, structure, batches):
+        """Insert the dataset from num_threads threads sharing one structure"""
+        chunk_size = len(self.metadata_list) // self.num_threads
+        threads = []
+        
+        start_time = time.perf_counter()
+        for i in range(self.num_threads):
+            start_idx = i * chunk_size
+            end_idx = start_idx + chunk_size if i < self.num_threads - 1 else len(self.metadata_list)
+            chunk = self.metadata_list[start_idx:end_idx]
+            
+            t = threading.Thread(
+                target=self._insert_worker,
+                args=(structure, chunk, batches, i)
+            )
+            threads.append(t)
+            t.start()
+        
+        for t in threads:
+            t.join()
+        
+        insert_duration = time.perf_counter() - start_time
+        return insert_duration
+    
+    def _insert_bulk(self, structure, batches):
+        """Populate structure with a single bulk_load call"""
+        start_time = time.perf_counter()
+        structure.bulk_load(self.metadata_list)
+        insert_duration = time.perf_counter() - start_time
+        batches[:] = [(len(self.metadata_list), insert_duration)]
+        return insert_duration
+    
+    def _insert_processes(self, structure, batches):
+        """
+        Insert the dataset from one process per hash shard.
+        Returns (ShardedIndex, duration, overhead): duration is the slowest
+        shard's build, overhead the rest of the wall time (pool start-up,
+        pickling shards out and back, rebuilding them here).
+        """
+        shards = ShardedIndex.partition(self.metadata_list, self.num_threads)
+        
+        # Each worker receives its own pickled copy of the empty structure
+        start_time = time.perf_counter()
+        with multiprocessing.Pool(self.num_threads) as pool:
+            built = pool.starmap(build_shard, [(structure, shard, self.bulk) for shard in shards])
+        wall_duration = time.perf_counter() - start_time
+        
+        for i, (_, count, duration) in enumerate(built):
+            batches[i] = (count, duration)
+        insert_duration = max(duration for _, _, duration in built)
+        return ShardedIndex([shard for shard, _, _ in built]), insert_duration, wall_duration - insert_duration
+    
+    def _insert_worker(self, structure, metadata_list, batches, slot):
+        """Worker for inserting metadata; records (count, duration) in its slot"""
+        start = time.perf_counter()
         for metadata in metadata_list:
-            start = time.perf_counter()
             structure.insert(metadata)
-            end = time.perf_counter()
-            metrics['insert_times'].append(end - start)
+        batches[slot] = (len(metadata_list), time.perf_counter() - start)
     
     def print_comparison(self):
         """Print comprehensive comparison"""
         print(f"\n{'='*80}")
         print(f"PERFORMANCE COMPARISON SUMMARY")
         print(f"{'='*80}")
-        print(f"Dataset: {self.num_entries} entries, {self.num_threads} threads\n")
+        workers = "processes (rebuilt shards)" if self.use_processes else "threads"
+        print(f"Dataset: {self.num_entries} entries, {self.num_threads} {workers}\n")
         
         # Create comparison table
         print(f"{'Metric':<30} {'Hash Table':<20} {'B+ Tree':<20}")
@@ -129,22 +196,24 @@ class PerformanceComparator:
         bt = self.results.get('B+ Tree', {})
         
         print(f"{'Total Insert Time (s)':<30} {ht.get('total_insert_time', 0):<20.4f} {bt.get('total_insert_time', 0):<20.4f}")
+        if self.use_processes:
+            print(f"{'Process Overhead (s)':<30} {ht.get('process_overhead', 0):<20.4f} {bt.get('process_overhead', 0):<20.4f}")
         print(f"{'Avg Insert Time (ms)':<30} {ht.get('avg_insert_time', 0)*1000:<20.6f} {bt.get('avg_insert_time', 0)*1000:<20.6f}")
         print(f"{'Avg Search Time (ms)':<30} {ht.get('avg_search_time', 0)*1000:<20.6f} {bt.get('avg_search_time', 0)*1000:<20.6f}")
         print(f"{'List Time (s)':<30} {ht.get('list_time', 0):<20.4f} {bt.get('list_time', 0):<20.4f}")
+        print(f"{'Memory (KB)':<30} {ht.get('memory_estimate', 0)/1024:<20.1f} {bt.get('memory_estimate', 0)/1024:<20.1f}")
         print(f"{'Final Size':<30} {ht.get('size', 0):<20} {bt.get('size', 0):<20}")
         
         print(f"\n{'='*80}")
         print("STRUCTURE-SPECIFIC STATISTICS")
         print(f"{'='*80}")
+        if self.use_processes:
+            print("Shards were rebuilt after pickling; figures below describe the rebuilt shards")
         
         if 'Hash Table' in self.results and 'stats' in self.results['Hash Table']:
             print("\nHash Table:")
             stats = self.results['Hash Table']['stats']
-            print(f"  Capacity:            {stats['capacity']}")
-            print(f"  Load Factor:         {stats['load_factor']:.4f}")
-            print(f"  Max Chain Length:    {stats['max_chain_length']}")
-            print(f"  Avg Chain Length:    {stats['avg_chain_length']:.2f}")
+            print(f"  Table Size (bytes):  {stats['table_bytes']}")
         
         if 'B+ Tree' in self.results and 'stats' in self.results['B+ Tree']:
             print("\nB+ Tree:")
@@ -178,7 +247,7 @@ def run_comparison(num_entries=5000, num_threads=5):
     comparator = PerformanceComparator(num_entries, num_threads)
     
     # Benchmark Hash Table
-    hash_table = HashTableIndex(initial_capacity=1024)
+    hash_table = HashTableIndex()
     comparator.benchmark_structure(hash_table, "Hash Table")
     
     # Benchmark B+ Tree
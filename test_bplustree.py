@@ -0,0 +1,210 @@
+import pickle
+import random
+import sys
+import threading
+import unittest
+from datetime import datetime
+
+from bPlusTree import BPlusTree
+from utils import FileMetadata, MetadataGenerator
+
+def make(filename, tags=()):
+    return FileMetadata(filename, "alice", datetime(2024, 1, 1), tuple(tags), "rw", 1024)
+
+def check_structure(tree):
+    """Assert B-link invariants: sorted nodes, one leaf depth, consistent links and high keys"""
+    def walk(node, depth, lo, hi):
+        keys = node.keys_fn if node.is_leaf else node.keys
+        assert keys == sorted(keys), keys
+        assert all((lo is None or lo <= k) and (hi is None or k < hi) for k in keys)
+        if node.high_key is not None:
+            assert all(k < node.high_key for k in keys)
+        if node.is_leaf:
+            assert len(node.values) == len(keys)
+            return {depth}
+        assert len(node.children) == len(keys) + 1
+        bounds = [lo] + keys + [hi]
+        depths = set()
+        for i, child in enumerate(node.children):
+            depths |= walk(child, depth + 1, bounds[i], bounds[i + 1])
+        return depths
+    
+    assert walk(tree.root, 1, None, None) == {tree.get_height()}
+    
+    # The leaf chain visits every key once, in order
+    node = tree.root
+    while not node.is_leaf:
+        node = node.children[0]
+    chained = []
+    while node is not None:
+        if node.next is not None:
+            assert node.high_key is not None and node.next.keys_fn[0] >= node.high_key
+        chained.extend(node.keys_fn)
+        node = node.next
+    assert chained == sorted(set(chained)) and len(chained) == tree.get_size()
+
+
+class InsertSearchTest(unittest.TestCase):
+    
+    def test_small_orders_split_correctly(self):
+        rng = random.Random(1)
+        data = MetadataGenerator.generate_metadata(2000, rng)
+        rng.shuffle(data)
+        for order in (3, 4, 5, 50):
+            tree = BPlusTree(order=order)
+            for metadata in data:
+                tree.insert(metadata)
+            check_structure(tree)
+            self.assertEqual(tree.get_size(), len(data))
+            names = sorted(m.filename for m in data)
+            self.assertEqual([m.filename for m in tree.list_files()], names)
+            self.assertEqual([m.filename for m in tree.list_files('desc')], names[::-1])
+            for metadata in data:
+                self.assertIs(tree.search_by_filename(metadata.filename), metadata)
+            self.assertIsNone(tree.search_by_filename("missing"))
+    
+    def test_duplicate_insert_replaces_without_growing(self):
+        tree = BPlusTree(order=4)
+        for i in range(10):
+            tree.insert(make(f"f{i}"))
+        replacement = make("f3")
+        tree.insert(replacement)
+        self.assertEqual(tree.get_size(), 10)
+        self.assertIs(tree.search_by_filename("f3"), replacement)
+    
+    def test_search_by_tag(self):
+        rng = random.Random(2)
+        data = MetadataGenerator.generate_metadata(500, rng)
+        tree = BPlusTree(order=8)
+        for metadata in data:
+            tree.insert(metadata)
+        for tag in MetadataGenerator.TAGS:
+            expected = sorted(m.filename for m in data if tag in m.tags)
+            self.assertEqual(sorted(m.filename for m in tree.search_by_tag(tag)), expected)
+
+
+class ConcurrencyTest(unittest.TestCase):
+    
+    def setUp(self):
+        # Switch threads as often as possible to exercise the latch protocol
+        self._interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+    
+    def tearDown(self):
+        sys.setswitchinterval(self._interval)
+    
+    def test_concurrent_writers_and_lock_free_readers(self):
+        for order in (4, 50):
+            rng = random.Random(order)
+            data = MetadataGenerator.generate_metadata(20000, rng)
+            rng.shuffle(data)
+            preloaded, rest = data[:2000], data[2000:]
+            tree = BPlusTree(order=order)
+            for metadata in preloaded:
+                tree.insert(metadata)
+            
+            errors = []
+            stop = threading.Event()
+            
+            def writer(chunk):
+                for metadata in chunk:
+                    tree.insert(metadata)
+            
+            def reader(seed):
+                reader_rng = random.Random(seed)
+                while not stop.is_set():
+                    metadata = reader_rng.choice(preloaded)
+                    if tree.search_by_filename(metadata.filename) is not metadata:
+                        errors.append(metadata.filename)
+                    names = [m.filename for m in tree.list_files()]
+                    if names != sorted(set(names)) or len(names) < len(preloaded):
+                        errors.append("list_files")
+            
+            writers = [threading.Thread(target=writer, args=(rest[i::8],)) for i in range(8)]
+            readers = [threading.Thread(target=reader, args=(i,)) for i in range(3)]
+            for t in writers + readers:
+                t.start()
+            for t in writers:
+                t.join()
+            stop.set()
+            for t in readers:
+                t.join()
+            
+            self.assertEqual(errors, [])
+            check_structure(tree)
+            self.assertEqual(tree.get_size(), len(data))
+            self.assertEqual([m.filename for m in tree.list_files()],
+                             sorted(m.filename for m in data))
+
+
+class BulkLoadTest(unittest.TestCase):
+    
+    def test_bulk_load_matches_inserts(self):
+        rng = random.Random(3)
+        data = MetadataGenerator.generate_metadata(3000, rng)
+        rng.shuffle(data)
+        for order in (3, 4, 50):
+            tree = BPlusTree(order=order)
+            tree.bulk_load(data)
+            check_structure(tree)
+            self.assertEqual([m.filename for m in tree.list_files()],
+                             sorted(m.filename for m in data))
+            
+            # The bulk-built tree keeps accepting inserts and splits
+            for i in range(200):
+                tree.insert(make(f"zz_{i:03d}"))
+            check_structure(tree)
+            self.assertEqual(tree.get_size(), len(data) + 200)
+    
+    def test_bulk_load_later_duplicates_win(self):
+        first, second = make("dup"), make("dup")
+        tree = BPlusTree(order=4)
+        tree.bulk_load([make("a"), first, second])
+        self.assertEqual(tree.get_size(), 2)
+        self.assertIs(tree.search_by_filename("dup"), second)
+    
+    def test_bulk_load_empty(self):
+        tree = BPlusTree(order=4)
+        tree.bulk_load([])
+        self.assertEqual(tree.list_files(), [])
+        self.assertEqual(tree.get_height(), 1)
+    
+    def test_bulk_load_replaces_existing_contents(self):
+        tree = BPlusTree(order=4)
+        for i in range(20):
+            tree.insert(make(f"old_{i:02d}", tags=("x",)))
+        
+        tree.bulk_load([make("f2", tags=("y",))])
+        
+        self.assertEqual([m.filename for m in tree.list_files()], ["f2"])
+        self.assertEqual(tree.get_size(), 1)
+        self.assertEqual(tree.search_by_tag("x"), [])
+        self.assertEqual([m.filename for m in tree.search_by_tag("y")], ["f2"])
+        self.assertIsNone(tree.search_by_filename("old_00"))
+
+
+class PickleTest(unittest.TestCase):
+    
+    def test_round_trip(self):
+        rng = random.Random(4)
+        data = MetadataGenerator.generate_metadata(1000, rng)
+        tree = BPlusTree(order=5)
+        for metadata in data:
+            tree.insert(metadata)
+        
+        copy = pickle.loads(pickle.dumps(tree))
+        check_structure(copy)
+        self.assertEqual([m.filename for m in copy.list_files()],
+                         [m.filename for m in tree.list_files()])
+        self.assertEqual(copy.get_size(), tree.get_size())
+        for tag in MetadataGenerator.TAGS:
+            self.assertEqual(len(copy.search_by_tag(tag)), len(tree.search_by_tag(tag)))
+        
+        # Locks and latches are rebuilt, so the copy accepts inserts
+        copy.insert(make("zzz", tags=("work",)))
+        self.assertEqual(copy.search_by_filename("zzz").filename, "zzz")
+        self.assertEqual(copy.get_size(), tree.get_size() + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import pickle
+import random
+import sys
+import threading
+import unittest
+from datetime import datetime
+
+from twoThreeTree import TwoThreeTree
+from utils import FileMetadata, MetadataGenerator
+
+def make(filename, tags=()):
+    return FileMetadata(filename, "alice", datetime(2024, 1, 1), tuple(tags), "rw", 1024)
+
+def check_structure(tree):
+    """Assert 2-3 invariants: 1-2 sorted keys per node, all leaves at tree height"""
+    def walk(node, depth, lo, hi):
+        assert 1 <= len(node.keys) <= 2 and node.keys == sorted(node.keys)
+        assert len(node.rows) == len(node.keys)
+        assert all((lo is None or lo <= k) and (hi is None or k <= hi) for k in node.keys)
+        if node.is_leaf():
+            return {depth}
+        assert len(node.children) == len(node.keys) + 1
+        bounds = [lo] + node.keys + [hi]
+        depths = set()
+        for i, child in enumerate(node.children):
+            depths |= walk(child, depth + 1, bounds[i], bounds[i + 1])
+        return depths
+    
+    if tree.root is not None:
+        assert walk(tree.root, 1, None, None) == {tree.get_height()}
+
+
+class TwoThreeTreeTest(unittest.TestCase):
+    
+    def test_insert_search_and_list(self):
+        rng = random.Random(1)
+        data = MetadataGenerator.generate_metadata(3000, rng)
+        rng.shuffle(data)
+        tree = TwoThreeTree()
+        for metadata in data:
+            tree.insert(metadata)
+        
+        check_structure(tree)
+        self.assertEqual(tree.get_size(), len(data))
+        names = sorted(m.filename for m in data)
+        self.assertEqual([m.filename for m in tree.list_files()], names)
+        self.assertEqual([m.filename for m in tree.list_files('desc')], names[::-1])
+        for metadata in data:
+            self.assertIs(tree.search_by_filename(metadata.filename), metadata)
+        self.assertIsNone(tree.search_by_filename("missing"))
+    
+    def test_insert_many_matches_insert(self):
+        rng = random.Random(2)
+        data = MetadataGenerator.generate_metadata(1000, rng)
+        one, many = TwoThreeTree(), TwoThreeTree()
+        for metadata in data:
+            one.insert(metadata)
+        many.insert_many(data)
+        check_structure(many)
+        self.assertEqual(many.list_files(), one.list_files())
+        for tag in MetadataGenerator.TAGS:
+            self.assertEqual(many.search_by_tag(tag), one.search_by_tag(tag))
+    
+    def test_duplicates_are_listed_and_newest_is_found(self):
+        tree = TwoThreeTree()
+        for name in "cbaedfg":
+            tree.insert(make(name))
+        newest = make("c")
+        tree.insert(newest)
+        check_structure(tree)
+        self.assertEqual([m.filename for m in tree.list_files()], list("abccdefg"))
+        self.assertIs(tree.search_by_filename("c"), newest)
+    
+    def test_tags_outside_the_generator_vocabulary(self):
+        tree = TwoThreeTree()
+        tree.insert(make("a", tags=("custom", "work")))
+        tree.insert_many([make("b", tags=("custom",))])
+        self.assertEqual([m.filename for m in tree.search_by_tag("custom")], ["a", "b"])
+        self.assertEqual([m.filename for m in tree.search_by_tag("work")], ["a"])
+        self.assertEqual(tree.search_by_tag("unknown"), [])
+    
+    def test_duplicate_tags_match_insert_many(self):
+        one, many = TwoThreeTree(), TwoThreeTree()
+        metadata = make("a", tags=("work", "work"))
+        one.insert(metadata)
+        many.insert_many([metadata])
+        self.assertEqual(one.search_by_tag("work"), many.search_by_tag("work"))
+    
+    def test_empty_tree(self):
+        tree = TwoThreeTree()
+        self.assertEqual(tree.list_files(), [])
+        self.assertIsNone(tree.search_by_filename("a"))
+        self.assertEqual(tree.get_size(), 0)
+
+
+class ConcurrencyTest(unittest.TestCase):
+    
+    def setUp(self):
+        self._interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+    
+    def tearDown(self):
+        sys.setswitchinterval(self._interval)
+    
+    def test_concurrent_writers_and_lock_free_readers(self):
+        rng = random.Random(4)
+        data = MetadataGenerator.generate_metadata(8000, rng)
+        rng.shuffle(data)
+        preloaded, rest = data[:1000], data[1000:]
+        tree = TwoThreeTree()
+        tree.insert_many(preloaded)
+        
+        errors = []
+        stop = threading.Event()
+        
+        def writer(chunk):
+            for i in range(0, len(chunk), 50):
+                tree.insert_many(chunk[i:i + 50])
+        
+        def reader(seed):
+            reader_rng = random.Random(seed)
+            while not stop.is_set():
+                metadata = reader_rng.choice(preloaded)
+                if tree.search_by_filename(metadata.filename) is not metadata:
+                    errors.append(metadata.filename)
+                names = [m.filename for m in tree.list_files()]
+                if names != sorted(names) or len(names) < len(preloaded):
+                    errors.append("list_files")
+        
+        writers = [threading.Thread(target=writer, args=(rest[i::5],)) for i in range(5)]
+        readers = [threading.Thread(target=reader, args=(i,)) for i in range(3)]
+        for t in writers + readers:
+            t.start()
+        for t in writers:
+            t.join()
+        stop.set()
+        for t in readers:
+            t.join()
+        
+        self.assertEqual(errors, [])
+        check_structure(tree)
+        self.assertEqual(tree.get_size(), len(data))
+        self.assertEqual([m.filename for m in tree.list_files()],
+                         sorted(m.filename for m in data))
+        for tag in MetadataGenerator.TAGS:
+            expected = sorted(m.filename for m in data if tag in m.tags)
+            self.assertEqual(sorted(m.filename for m in tree.search_by_tag(tag)), expected)
+
+
+class PickleTest(unittest.TestCase):
+    
+    def test_round_trip(self):
+        rng = random.Random(5)
+        data = MetadataGenerator.generate_metadata(1000, rng)
+        tree = TwoThreeTree()
+        tree.insert_many(data)
+        tree.insert(make("custom_file", tags=("custom",)))
+        
+        copy = pickle.loads(pickle.dumps(tree))
+        check_structure(copy)
+        self.assertEqual([m.filename for m in copy.list_files()],
+                         [m.filename for m in tree.list_files()])
+        self.assertEqual(copy.get_size(), tree.get_size())
+        self.assertEqual(copy.get_height(), tree.get_height())
+        for tag in MetadataGenerator.TAGS + ("custom",):
+            self.assertEqual([m.filename for m in copy.search_by_tag(tag)],
+                             [m.filename for m in tree.search_by_tag(tag)])
+        
+        # Locks are rebuilt, so the copy accepts inserts
+        copy.insert(make("zzz", tags=("custom",)))
+        self.assertEqual([m.filename for m in copy.search_by_tag("custom")], ["custom_file", "zzz"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import multiprocessing
+import pickle
+import random
+import threading
+import unittest
+from datetime import datetime
+
+from bPlusTree import BPlusTree
+from hashmap import HashTableIndex
+from twoThreeTree import TwoThreeTree
+from utils import FileMetadata, MetadataGenerator, ShardedIndex, TagIndex, build_shard
+
+def make(filename, tags=()):
+    return FileMetadata(filename, "alice", datetime(2024, 1, 1), tuple(tags), "rw", 1024)
+
+
+class TagIndexTest(unittest.TestCase):
+    
+    def test_search_keeps_insertion_order_across_compaction(self):
+        index = TagIndex()
+        added = []
+        # Interleave adds and searches across several compactions
+        for i in range(3 * TagIndex.COMPACT_MIN):
+            metadata = make(f"f{i}", tags=("even",) if i % 2 == 0 else ("odd", "all"))
+            index.add(metadata)
+            added.append(metadata)
+            if i % 997 == 0:
+                self.assertEqual(index.search("even"), [m for m in added if "even" in m.tags])
+        for tag in ("even", "odd", "all"):
+            self.assertEqual(index.search(tag), [m for m in added if tag in m.tags])
+        self.assertEqual(index.search("missing"), [])
+    
+    def test_adds_from_many_threads(self):
+        index = TagIndex()
+        chunks = [[make(f"t{t}_{i}", tags=("x",)) for i in range(500)] for t in range(8)]
+        
+        def worker(chunk):
+            for metadata in chunk:
+                index.add(metadata)
+        
+        threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        found = index.search("x")
+        self.assertEqual(sorted(m.filename for m in found),
+                         sorted(m.filename for chunk in chunks for m in chunk))
+    
+    def test_round_trip(self):
+        index = TagIndex()
+        for i in range(100):
+            index.add(make(f"f{i}", tags=("a",) if i % 3 else ("a", "b")))
+        copy = pickle.loads(pickle.dumps(index))
+        for tag in ("a", "b"):
+            self.assertEqual([m.filename for m in copy.search(tag)],
+                             [m.filename for m in index.search(tag)])
+        copy.add(make("new", tags=("b",)))
+        self.assertEqual(copy.search("b")[-1].filename, "new")
+
+
+class ShardedIndexTest(unittest.TestCase):
+    
+    FACTORIES = (HashTableIndex, lambda: BPlusTree(order=8), TwoThreeTree)
+    
+    def setUp(self):
+        self.data = MetadataGenerator.generate_metadata(1200, random.Random(1))
+    
+    def check_index(self, index):
+        names = sorted(m.filename for m in self.data)
+        self.assertEqual(index.get_size(), len(self.data))
+        self.assertEqual([m.filename for m in index.list_files()], names)
+        self.assertEqual([m.filename for m in index.list_files('desc')], names[::-1])
+        for metadata in self.data:
+            self.assertEqual(index.search_by_filename(metadata.filename).filename, metadata.filename)
+        for tag in MetadataGenerator.TAGS:
+            expected = sorted(m.filename for m in self.data if tag in m.tags)
+            self.assertEqual(sorted(m.filename for m in index.search_by_tag(tag)), expected)
+    
+    def test_partition_routes_by_shard_index(self):
+        shards = ShardedIndex.partition(self.data, 4)
+        self.assertEqual(sum(len(shard) for shard in shards), len(self.data))
+        for i, shard in enumerate(shards):
+            for metadata in shard:
+                self.assertEqual(ShardedIndex.shard_index(metadata.filename, 4), i)
+    
+    def test_in_process_shards(self):
+        for factory in self.FACTORIES:
+            shards = ShardedIndex.partition(self.data, 3)
+            index = ShardedIndex([build_shard(factory(), shard)[0] for shard in shards])
+            self.check_index(index)
+    
+    def test_insert_routes_to_one_shard(self):
+        index = ShardedIndex([HashTableIndex() for _ in range(3)])
+        for metadata in self.data:
+            index.insert(metadata)
+        self.check_index(index)
+        stats = index.get_stats()
+        self.assertEqual(stats['shards'], 3)
+        self.assertEqual(stats['size'], len(self.data))
+    
+    def test_shards_built_in_worker_processes(self):
+        shards = ShardedIndex.partition(self.data, 3)
+        for factory in self.FACTORIES:
+            with multiprocessing.Pool(3) as pool:
+                built = pool.starmap(build_shard, [(factory(), shard) for shard in shards])
+            self.assertEqual([count for _, count, _ in built], [len(shard) for shard in shards])
+            self.check_index(ShardedIndex([structure for structure, _, _ in built]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,17 +1,20 @@
+import bisect
+import multiprocessing
 import threading
 import random
 import time
-from datetime import datetime, timedelta
-from dataclasses import dataclass, field
 from typing import List, Optional
 from collections import defaultdict
-from utils import FileMetadata, MetadataGenerator
+from utils import FileMetadata, MetadataGenerator, ShardedIndex, build_shard
 
 class TwoThreeNode:
-    """Node in a 2-3 tree with 1-2 keys and 2-3 children"""
-    def __init__(self):
-        self.keys = []  # List of FileMetadata objects (1 or 2)
-        self.children = []  # List of child nodes (0, 2, or 3)
+    """Node in a 2-3 tree with 1-2 keys and 2-3 children (immutable once published)"""
+    __slots__ = ('keys', 'rows', 'children')
+    
+    def __init__(self, keys=None, rows=None, children=None):
+        self.keys = keys if keys is not None else []  # List of filenames (1 or 2), compared directly
+        self.rows = rows if rows is not None else []  # Row ids, parallel to keys
+        self.children = children if children is not None else []  # List of child nodes (0, 2, or 3)
     
     def is_leaf(self):
         return len(self.children) == 0
@@ -20,242 +23,293 @@ class TwoThreeNode:
         return len(self.keys) == 2
     
     def __repr__(self):
-        key_names = [k.filename for k in self.keys]
-        return f"Node(keys={key_names}, children={len(self.children)})"
+        return f"Node(keys={self.keys}, children={len(self.children)})"
 
 
 class TwoThreeTree:
     """
     2-3 Tree implementation for metadata indexing.
-    Supports concurrent access with read-write locks.
+    Writers copy the insertion path and publish a new root under a lock;
+    readers take a snapshot of the root and traverse it without locking.
+    Point lookups by filename are served from a dict kept alongside the
+    tree; the tree provides ordered listing.
+    Nodes hold filenames as keys, compared as plain strings, with a parallel
+    list of integer row ids; the filename dict and the tag index hold row
+    ids too, and FileMetadata objects are only materialized for results.
     """
+    TAG_SHARDS = 16  # Power of two; a tag's lock is tag_id & (TAG_SHARDS - 1)
+    
     def __init__(self):
         self.root = None
-        self.lock = threading.RLock()  # Reentrant lock for nested calls
+        self.lock = threading.Lock()  # Serializes writers; never taken re-entrantly
         self.size = 0
         self.height = 0
+        self.by_name = {}  # filename -> row id
+        
+        # Row store, indexed by row id; append-only
+        self._rows: List[FileMetadata] = []
         
-        # Secondary indices for tag-based search
-        self.tag_index = defaultdict(list)  # tag -> [FileMetadata]
-        self.tag_lock = threading.RLock()
+        # Secondary index for tag-based search, by tag id. Ids for the
+        # generator's closed vocabulary are fixed up front; unseen tags get
+        # the next id. Lists are sharded across locks so updates to
+        # different tags don't contend on one lock.
+        self._tag_ids = {tag: i for i, tag in enumerate(MetadataGenerator.TAGS)}
+        self.tag_index = [[] for _ in self._tag_ids]  # tag id -> [row id]
+        self.tag_locks = [threading.Lock() for _ in range(self.TAG_SHARDS)]
     
     def insert(self, metadata: FileMetadata):
         """Insert metadata into the tree (thread-safe)"""
+        self.insert_many((metadata,))
+    
+    def insert_many(self, items: List[FileMetadata]):
+        """Insert a batch of metadata under a single lock acquisition (thread-safe)"""
+        groups = defaultdict(list)  # tag id -> the batch's row ids
         with self.lock:
-            if self.root is None:
-                self.root = TwoThreeNode()
-                self.root.keys.append(metadata)
-                self.height = 1
-            else:
-                new_root = self._insert_helper(self.root, metadata)
-                if new_root is not None:
-                    self.root = new_root
-                    self.height += 1
-            
-            self.size += 1
-            
-            # Update tag index
-            with self.tag_lock:
+            for metadata in items:
+                row = self._insert_one(metadata)
                 for tag in metadata.tags:
-                    self.tag_index[tag].append(metadata)
-    
-    def _insert_helper(self, node, metadata):
-        """Recursive insertion helper"""
+                    groups[self._tag_id(tag)].append(row)
+        self._index_tags(groups)
+    
+    def _tag_id(self, tag):
+        """Return the id of tag, allocating one if it is new (caller holds lock)"""
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = len(self.tag_index)
+            self.tag_index.append([])
+            self._tag_ids[tag] = tag_id
+        return tag_id
+    
+    def _index_tags(self, groups):
+        """Extend each tag's list by its rows in one step, locking only that tag's shard"""
+        mask = self.TAG_SHARDS - 1
+        for tag_id, rows in groups.items():
+            with self.tag_locks[tag_id & mask]:
+                self.tag_index[tag_id].extend(rows)
+    
+    def _insert_one(self, metadata):
+        """Insert into the tree without locking (caller holds lock); returns the row id"""
+        # The row is stored before its id is reachable from the root
+        row = len(self._rows)
+        self._rows.append(metadata)
+        
+        if self.root is None:
+            new_root = TwoThreeNode([metadata.filename], [row])
+            self.height = 1
+        else:
+            new_root, split = self._insert_helper(self.root, metadata.filename, row)
+            if split:
+                self.height += 1
+        
+        # Point lookups see the row no later than listings do
+        self.by_name[metadata.filename] = row
+        
+        # Publish the new version; readers holding the old root are unaffected
+        self.root = new_root
+        
+        self.size += 1
+        return row
+    
+    def _insert_helper(self, node, name, row):
+        """
+        Recursive path-copying insertion helper; never mutates existing nodes.
+        Returns (new_node, split): the copy replacing node, or when split is
+        True a 1-key node whose two children replace node.
+        """
         if node.is_leaf():
-            return self._insert_into_node(node, metadata)
+            return self._insert_into_node(node, name, row)
         else:
             # Find appropriate child
-            child_index = self._find_child_index(node, metadata)
-            new_child = self._insert_helper(node.children[child_index], metadata)
+            child_index = self._find_child_index(node, name)
+            new_child, split = self._insert_helper(node.children[child_index], name, row)
             
-            if new_child is not None:
+            if split:
                 # Child split occurred, insert middle key into current node
-                middle_key = new_child.keys[0]
-                return self._insert_into_internal(node, middle_key, new_child, child_index)
-            return None
-    
-    def _insert_into_node(self, node, metadata):
-        """Insert into a leaf node"""
-        # Insert in sorted order
-        inserted = False
-        for i, key in enumerate(node.keys):
-            if metadata < key:
-                node.keys.insert(i, metadata)
-                inserted = True
-                break
-        if not inserted:
-            node.keys.append(metadata)
-        
-        # Check if split is needed
-        if len(node.keys) == 3:
-            return self._split_node(node)
-        return None
-    
-    def _insert_into_internal(self, node, middle_key, new_child, child_index):
-        """Insert middle key from split child into internal node"""
-        # Insert middle key
-        inserted = False
-        for i, key in enumerate(node.keys):
-            if middle_key < key:
-                node.keys.insert(i, middle_key)
-                node.children.insert(i + 1, new_child.children[1])
-                inserted = True
-                break
-        
-        if not inserted:
-            node.keys.append(middle_key)
-            node.children.append(new_child.children[1])
+                return self._insert_into_internal(node, new_child, child_index)
+            
+            children = list(node.children)
+            children[child_index] = new_child
+            return TwoThreeNode(node.keys, node.rows, children), False
+    
+    def _insert_into_node(self, node, name, row):
+        """Insert into a copy of a leaf node"""
+        # Insert in sorted order; a leaf has 1 or 2 keys, so spell out each
+        # position instead of copying and calling list.insert
+        if len(node.keys) == 1:
+            k0, = node.keys
+            r0, = node.rows
+            if name < k0:
+                return TwoThreeNode([name, k0], [row, r0]), False
+            return TwoThreeNode([k0, name], [r0, row]), False
         
-        # Update child pointer
-        node.children[child_index] = new_child.children[0]
+        # Full leaf: the 3 keys always split
+        k0, k1 = node.keys
+        r0, r1 = node.rows
+        if name < k0:
+            keys, rows = [name, k0, k1], [row, r0, r1]
+        elif name < k1:
+            keys, rows = [k0, name, k1], [r0, row, r1]
+        else:
+            keys, rows = [k0, k1, name], [r0, r1, row]
+        return self._split_node(keys, rows, []), True
+    
+    def _insert_into_internal(self, node, split_child, child_index):
+        """Insert middle key from split child into a copy of internal node"""
+        # The middle key belongs between the keys around the child it came from
+        keys = node.keys[:child_index] + split_child.keys + node.keys[child_index:]
+        rows = node.rows[:child_index] + split_child.rows + node.rows[child_index:]
+        children = node.children[:child_index] + split_child.children + node.children[child_index + 1:]
         
         # Check if split needed
-        if len(node.keys) == 3:
-            return self._split_node(node)
-        return None
-    
-    def _split_node(self, node):
-        """Split a node with 3 keys into two nodes with 1 key each"""
-        left = TwoThreeNode()
-        right = TwoThreeNode()
-        middle = TwoThreeNode()
-        
-        # Distribute keys
-        left.keys = [node.keys[0]]
-        middle.keys = [node.keys[1]]
-        right.keys = [node.keys[2]]
-        
-        # Distribute children if not leaf
-        if not node.is_leaf():
-            left.children = node.children[0:2]
-            right.children = node.children[2:4]
-        
-        middle.children = [left, right]
-        return middle
+        if len(keys) == 3:
+            return self._split_node(keys, rows, children), True
+        return TwoThreeNode(keys, rows, children), False
     
-    def _find_child_index(self, node, metadata):
+    def _split_node(self, keys, rows, children):
+        """Split 3 keys (and 4 children, if internal) into two 1-key nodes under a middle node"""
+        left = TwoThreeNode(keys[0:1], rows[0:1], children[0:2])
+        right = TwoThreeNode(keys[2:3], rows[2:3], children[2:4])
+        return TwoThreeNode(keys[1:2], rows[1:2], [left, right])
+    
+    def _find_child_index(self, node, filename):
         """Find which child to traverse for insertion/search"""
-        for i, key in enumerate(node.keys):
-            if metadata < key:
-                return i
-        return len(node.keys)
+        return bisect.bisect_right(node.keys, filename)
     
     def search_by_filename(self, filename: str) -> Optional[FileMetadata]:
-        """Search for metadata by filename (thread-safe)"""
-        with self.lock:
-            if self.root is None:
-                return None
-            return self._search_helper(self.root, filename)
-    
-    def _search_helper(self, node, filename):
-        """Recursive search helper"""
-        # Check keys in current node
-        for key in node.keys:
-            if key.filename == filename:
-                return key
-        
-        # If leaf, not found
-        if node.is_leaf():
-            return None
-        
-        # Traverse to appropriate child
-        for i, key in enumerate(node.keys):
-            if filename < key.filename:
-                return self._search_helper(node.children[i], filename)
-        
-        return self._search_helper(node.children[-1], filename)
+        """Search for metadata by filename (thread-safe, lock-free dict read)"""
+        row = self.by_name.get(filename)
+        return None if row is None else self._rows[row]
     
     def search_by_tag(self, tag: str) -> List[FileMetadata]:
         """Search for all files with a specific tag (thread-safe)"""
-        with self.tag_lock:
-            return self.tag_index.get(tag, []).copy()
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            return []
+        with self.tag_locks[tag_id & (self.TAG_SHARDS - 1)]:
+            rows = self.tag_index[tag_id].copy()
+        return [self._rows[row] for row in rows]
     
     def list_files(self, order='asc') -> List[FileMetadata]:
-        """List all files in order (thread-safe)"""
-        with self.lock:
-            result = []
-            self._inorder_traversal(self.root, result)
-            if order == 'desc':
-                result.reverse()
-            return result
+        """List all files in order (thread-safe, from a snapshot of the root)"""
+        ids = []
+        self._inorder_traversal(self.root, ids)
+        if order == 'desc':
+            ids.reverse()
+        rows = self._rows
+        return [rows[row] for row in ids]
     
     def _inorder_traversal(self, node, result):
-        """In-order traversal of the tree"""
+        """In-order traversal of the tree, collecting row ids"""
         if node is None:
             return
         
-        if node.is_leaf():
-            result.extend(node.keys)
-        else:
-            for i, key in enumerate(node.keys):
-                self._inorder_traversal(node.children[i], result)
-                result.append(key)
-            self._inorder_traversal(node.children[-1], result)
+        # Stack of (internal node, index of the next child to visit)
+        stack = []
+        while True:
+            if node.is_leaf():
+                result.extend(node.rows)
+            else:
+                stack.append((node, 1))
+                node = node.children[0]
+                continue
+            
+            # Climb to the nearest ancestor with an unvisited child
+            while stack:
+                parent, i = stack.pop()
+                if i < len(parent.children):
+                    result.append(parent.rows[i - 1])
+                    stack.append((parent, i + 1))
+                    node = parent.children[i]
+                    break
+            else:
+                return
     
     def get_height(self):
         """Return current tree height"""
-        with self.lock:
-            return self.height
+        return self.height
     
     def get_size(self):
         """Return number of elements"""
+        return self.size
+    
+    def __getstate__(self):
+        """Pickle the tree and indexes; locks are rebuilt on load"""
         with self.lock:
-            return self.size
+            tags = {}
+            for tag, tag_id in self._tag_ids.items():
+                with self.tag_locks[tag_id & (self.TAG_SHARDS - 1)]:
+                    tags[tag] = list(self.tag_index[tag_id])
+            return {'root': self.root, 'size': self.size, 'height': self.height,
+                    'by_name': self.by_name, 'rows': self._rows, 'tags': tags}
+    
+    def __setstate__(self, state):
+        self.__init__()
+        self.root = state['root']
+        self.size = state['size']
+        self.height = state['height']
+        self.by_name = state['by_name']
+        self._rows = state['rows']
+        for tag, rows in state['tags'].items():
+            self.tag_index[self._tag_id(tag)] = rows
 
 class PerformanceMetrics:
-    """Track and report performance metrics"""
+    """Track and report performance metrics (running totals, O(1) memory)"""
     def __init__(self):
-        self.insert_times = []
-        self.search_times = []
+        self._ins_sum = 0.0
+        self._ins_n = 0
+        self._srch_sum = 0.0
+        self._srch_n = 0
         self.lock = threading.Lock()
     
-    def record_insert(self, duration):
+    def record_batch(self, total, count):
+        """Record count inserts that took total seconds together"""
         with self.lock:
-            self.insert_times.append(duration)
+            self._ins_sum += total
+            self._ins_n += count
     
-    def record_search(self, duration):
+    def record_search_batch(self, total, count):
+        """Record count searches that took total seconds together"""
         with self.lock:
-            self.search_times.append(duration)
+            self._srch_sum += total
+            self._srch_n += count
     
     def get_stats(self):
         with self.lock:
             return {
-                'avg_insert_time': sum(self.insert_times) / len(self.insert_times) if self.insert_times else 0,
-                'avg_search_time': sum(self.search_times) / len(self.search_times) if self.search_times else 0,
-                'total_inserts': len(self.insert_times),
-                'total_searches': len(self.search_times)
+                'avg_insert_time': self._ins_sum / self._ins_n if self._ins_n else 0,
+                'avg_search_time': self._srch_sum / self._srch_n if self._srch_n else 0,
+                'total_inserts': self._ins_n,
+                'total_searches': self._srch_n
             }
 
 
 # ==================== WORKER THREADS ====================
 
 def insert_worker(tree, metadata_list, metrics):
-    """Worker thread for inserting metadata"""
-    for metadata in metadata_list:
-        start = time.perf_counter()
-        tree.insert(metadata)
-        end = time.perf_counter()
-        metrics.record_insert(end - start)
+    """Worker thread for inserting metadata as one batch"""
+    start = time.perf_counter()
+    tree.insert_many(metadata_list)
+    end = time.perf_counter()
+    metrics.record_batch(end - start, len(metadata_list))
 
 def search_worker(tree, filenames, metrics):
-    """Worker thread for searching metadata"""
+    """Worker thread for searching metadata, timed as one batch"""
+    start = time.perf_counter()
     for filename in filenames:
-        start = time.perf_counter()
         result = tree.search_by_filename(filename)
-        end = time.perf_counter()
-        metrics.record_search(end - start)
+    end = time.perf_counter()
+    metrics.record_search_batch(end - start, len(filenames))
 
 
 # ==================== MAIN SIMULATION ====================
 
-def run_simulation(num_entries=10000, num_threads=5):
+def run_simulation(num_entries=10000, num_threads=5, use_processes=False):
     """Run complete simulation and benchmarking"""
     print("=" * 60)
     print("METADATA INDEXING SYSTEM SIMULATION")
     print("=" * 60)
     
     # Initialize
-    tree = TwoThreeTree()
     metrics = PerformanceMetrics()
     
     # Generate dataset
@@ -263,30 +317,53 @@ def run_simulation(num_entries=10000, num_threads=5):
     metadata_list = MetadataGenerator.generate_metadata(num_entries)
     print(f"✓ Generated {len(metadata_list)} entries")
     
-    # Concurrent insertions
-    print(f"\n[2/4] Simulating concurrent insertions ({num_threads} threads)...")
-    chunk_size = len(metadata_list) // num_threads
-    threads = []
-    
-    start_time = time.time()
-    for i in range(num_threads):
-        start_idx = i * chunk_size
-        end_idx = start_idx + chunk_size if i < num_threads - 1 else len(metadata_list)
-        chunk = metadata_list[start_idx:end_idx]
+    if use_processes:
+        # Parallel insertions: one process builds the tree for each hash shard
+        print(f"\n[2/4] Simulating parallel insertions ({num_threads} processes)...")
+        shards = ShardedIndex.partition(metadata_list, num_threads)
         
-        t = threading.Thread(
-            target=insert_worker,
-            args=(tree, chunk, metrics),
-            name=f"InsertThread-{i}"
-        )
-        threads.append(t)
-        t.start()
-    
-    for t in threads:
-        t.join()
+        start_time = time.time()
+        with multiprocessing.Pool(num_threads) as pool:
+            built = pool.starmap(build_shard, [(TwoThreeTree(), shard) for shard in shards])
+        
+        wall_duration = time.time() - start_time
+        
+        for _, count, duration in built:
+            metrics.record_batch(duration, count)
+        tree = ShardedIndex([shard for shard, _, _ in built])
+        
+        # Report the slowest shard's build; pool start-up and pickling are overhead
+        insert_duration = max(duration for _, _, duration in built)
+        process_overhead = wall_duration - insert_duration
+    else:
+        # Concurrent insertions
+        print(f"\n[2/4] Simulating concurrent insertions ({num_threads} threads)...")
+        tree = TwoThreeTree()
+        chunk_size = len(metadata_list) // num_threads
+        threads = []
+        
+        start_time = time.time()
+        for i in range(num_threads):
+            start_idx = i * chunk_size
+            end_idx = start_idx + chunk_size if i < num_threads - 1 else len(metadata_list)
+            chunk = metadata_list[start_idx:end_idx]
+            
+            t = threading.Thread(
+                target=insert_worker,
+                args=(tree, chunk, metrics),
+                name=f"InsertThread-{i}"
+            )
+            threads.append(t)
+            t.start()
+        
+        for t in threads:
+            t.join()
+        
+        insert_duration = time.time() - start_time
     
-    insert_duration = time.time() - start_time
     print(f"✓ Inserted {tree.get_size()} entries in {insert_duration:.2f}s")
+    if use_processes:
+        print(f"  Process overhead: {process_overhead:.2f}s (pool start-up, pickling shards)")
     
     # Concurrent searches
     print(f"\n[3/4] Simulating concurrent searches ({num_threads} threads)...")
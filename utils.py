@@ -1,18 +1,29 @@
-from dataclasses import dataclass, field
+from array import array
+import bisect
 from datetime import datetime, timedelta
+import heapq
+from operator import attrgetter
 import random
+import sys
+import threading
+import time
 from typing import List, Optional, Dict, Tuple
 
-@dataclass
 class FileMetadata:
     """Represents metadata for a file in the distributed storage system"""
-    filename: str
-    owner: str
-    timestamp: datetime
-    tags: List[str]
-    permissions: str
-    file_size: int
-    file_id: str = field(default_factory=lambda: str(random.randint(100000, 999999)))
+    __slots__ = ('filename', 'owner', 'timestamp', 'tags', 'permissions',
+                 'file_size', 'file_id')
+    
+    def __init__(self, filename: str, owner: str, timestamp: datetime,
+                 tags: Tuple[str, ...], permissions: str, file_size: int,
+                 file_id: Optional[str] = None):
+        self.filename = filename
+        self.owner = owner
+        self.timestamp = timestamp
+        self.tags = tags
+        self.permissions = permissions
+        self.file_size = file_size
+        self.file_id = file_id if file_id is not None else str(random.randint(100000, 999999))
     
     def __lt__(self, other):
         return self.filename < other.filename
@@ -27,35 +38,211 @@ class FileMetadata:
         return f"FileMetadata({self.filename})"
     
 
+class TagIndex:
+    """
+    Secondary index from tag to files.
+    Inserts append to a per-thread buffer without locking; buffers are merged
+    into the shared index under one lock acquisition by flush(), which
+    search() calls lazily.
+    The merged index is columnar: parallel int arrays of tag ids and row ids,
+    sorted by tag, so a tag's files are one contiguous slice found by bisect.
+    Flushed rows wait in per-tag buckets and are folded into the columns
+    only once enough have built up that the O(N) rebuild is amortized.
+    """
+    COMPACT_MIN = 4096  # Pending (tag, row) pairs that always justify a rebuild
+    
+    def __init__(self):
+        self._tag_ids: Dict[str, int] = {}
+        self._rows: List[FileMetadata] = []  # Row id -> metadata
+        self._tag_col = array('i')  # Sorted tag ids
+        self._row_col = array('i')  # Row ids, parallel to _tag_col
+        self._pending: Dict[int, List[int]] = {}  # Tag id -> row ids not yet in the columns
+        self._pending_count = 0
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._buffers = []  # (thread, buffer) for every thread that inserted
+    
+    def add(self, metadata: FileMetadata):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = []
+            with self.lock:
+                self._buffers.append((threading.current_thread(), buffer))
+        buffer.append(metadata)
+    
+    def flush(self):
+        """Move all thread buffers into the shared index"""
+        with self.lock:
+            for thread, buffer in self._buffers:
+                # Owner may keep appending; only take what is there now
+                count = len(buffer)
+                pending = buffer[:count]
+                del buffer[:count]
+                for metadata in pending:
+                    row = len(self._rows)
+                    self._rows.append(metadata)
+                    for tag in metadata.tags:
+                        tag_id = self._tag_ids.setdefault(tag, len(self._tag_ids))
+                        self._pending.setdefault(tag_id, []).append(row)
+                        self._pending_count += 1
+            
+            # Drained buffers of finished threads can be forgotten
+            self._buffers = [(t, b) for t, b in self._buffers if t.is_alive() or b]
+            
+            if self._pending_count >= max(self.COMPACT_MIN, len(self._tag_col) // 4):
+                self._compact()
+    
+    def _compact(self):
+        """Merge the pending buckets into the sorted columns (caller holds lock)"""
+        if not self._pending:
+            return
+        pairs = sorted((tag_id, row) for tag_id, rows in self._pending.items() for row in rows)
+        merged = list(heapq.merge(zip(self._tag_col, self._row_col), pairs))
+        self._tag_col = array('i', [tag_id for tag_id, _ in merged])
+        self._row_col = array('i', [row for _, row in merged])
+        self._pending = {}
+        self._pending_count = 0
+    
+    def search(self, tag: str) -> List[FileMetadata]:
+        self.flush()
+        with self.lock:
+            tag_id = self._tag_ids.get(tag)
+            if tag_id is None:
+                return []
+            lo = bisect.bisect_left(self._tag_col, tag_id)
+            hi = bisect.bisect_right(self._tag_col, tag_id, lo)
+            rows = self._rows
+            # Pending rows were added after every compacted one, so they follow
+            result = [rows[row] for row in self._row_col[lo:hi]]
+            result.extend(rows[row] for row in self._pending.get(tag_id, ()))
+            return result
+    
+    def __getstate__(self):
+        """Pickle the merged index only; locks and thread buffers are rebuilt"""
+        self.flush()
+        with self.lock:
+            self._compact()
+            return {'tag_ids': self._tag_ids, 'rows': self._rows,
+                    'tag_col': self._tag_col, 'row_col': self._row_col}
+    
+    def __setstate__(self, state):
+        self.__init__()
+        self._tag_ids = state['tag_ids']
+        self._rows = state['rows']
+        self._tag_col = state['tag_col']
+        self._row_col = state['row_col']
+    
+
+class ShardedIndex:
+    """
+    Forest of independently built indexes, one per shard.
+    Filenames are routed to a shard by hash, so point lookups touch one
+    shard and ordered listings are an N-way merge of the shards' lists.
+    """
+    # Stats that add up across shards; all others report the worst shard
+    SUMMED_STATS = ('size', 'table_bytes')
+    
+    def __init__(self, shards):
+        self.shards = shards
+    
+    @staticmethod
+    def shard_index(filename, num_shards):
+        return hash(filename) % num_shards
+    
+    @staticmethod
+    def partition(metadata_list, num_shards):
+        """Split metadata_list into num_shards lists by filename hash"""
+        shards = [[] for _ in range(num_shards)]
+        for metadata in metadata_list:
+            shards[ShardedIndex.shard_index(metadata.filename, num_shards)].append(metadata)
+        return shards
+    
+    def _shard(self, filename):
+        return self.shards[self.shard_index(filename, len(self.shards))]
+    
+    def insert(self, metadata: FileMetadata):
+        self._shard(metadata.filename).insert(metadata)
+    
+    def search_by_filename(self, filename: str) -> Optional[FileMetadata]:
+        return self._shard(filename).search_by_filename(filename)
+    
+    def search_by_tag(self, tag: str) -> List[FileMetadata]:
+        result = []
+        for shard in self.shards:
+            result.extend(shard.search_by_tag(tag))
+        return result
+    
+    def list_files(self, order='asc') -> List[FileMetadata]:
+        return list(heapq.merge(*(shard.list_files(order) for shard in self.shards),
+                                key=attrgetter('filename'), reverse=(order == 'desc')))
+    
+    def get_size(self):
+        return sum(shard.get_size() for shard in self.shards)
+    
+    def get_height(self):
+        return max(shard.get_height() for shard in self.shards)
+    
+    def get_stats(self):
+        shard_stats = [shard.get_stats() for shard in self.shards]
+        stats = {'shards': len(self.shards)}
+        for key in shard_stats[0]:
+            combine = sum if key in self.SUMMED_STATS else max
+            stats[key] = combine(s[key] for s in shard_stats)
+        return stats
+
+
+def build_shard(structure, metadata_list, bulk=False):
+    """Process worker: insert one shard into a fresh copy of structure"""
+    start = time.perf_counter()
+    if bulk and hasattr(structure, 'bulk_load'):
+        structure.bulk_load(metadata_list)
+    elif hasattr(structure, 'insert_many'):
+        structure.insert_many(metadata_list)
+    else:
+        for metadata in metadata_list:
+            structure.insert(metadata)
+    return structure, len(metadata_list), time.perf_counter() - start
+
+
 class MetadataGenerator:
     """Generate realistic metadata for testing"""
     
     OWNERS = ["alice", "bob", "charlie", "diana", "eve", "frank", "grace", "henry"]
-    TAGS = ["work", "personal", "project", "backup", "archive", "shared", 
-            "important", "draft", "final", "review", "public", "private"]
+    # Interned so tag-index dict probes match on identity
+    TAGS = tuple(sys.intern(tag) for tag in
+                 ["work", "personal", "project", "backup", "archive", "shared",
+                  "important", "draft", "final", "review", "public", "private"])
     EXTENSIONS = [".txt", ".pdf", ".docx", ".jpg", ".png", ".mp4", ".zip", ".py", ".java", ".cpp"]
     
+    PERMISSIONS = ["rw", "r", "rwx"]
+    
     @staticmethod
-    def generate_metadata(count=10000):
-        """Generate random metadata entries"""
-        metadata_list = []
+    def generate_metadata(count=10000, rng=None):
+        """Generate random metadata entries (rng: a random.Random, default the global one)"""
+        if rng is None:
+            rng = random
+        gen = MetadataGenerator
         base_time = datetime.now()
         
+        # Draw each field for the whole batch in one call
+        exts = rng.choices(gen.EXTENSIONS, k=count)
+        owners = rng.choices(gen.OWNERS, k=count)
+        stamps = rng.choices([base_time - timedelta(days=d) for d in range(366)], k=count)
+        tag_counts = rng.choices(range(1, 5), k=count)
+        permissions = rng.choices(gen.PERMISSIONS, k=count)
+        sizes = rng.choices(range(1024, 10485761), k=count)  # 1KB to 10MB
+        file_ids = rng.choices(range(100000, 1000000), k=count)
+        
+        metadata_list = []
         for i in range(count):
-            filename = f"file_{i:05d}{random.choice(MetadataGenerator.EXTENSIONS)}"
-            owner = random.choice(MetadataGenerator.OWNERS)
-            timestamp = base_time - timedelta(days=random.randint(0, 365))
-            tags = random.sample(MetadataGenerator.TAGS, k=random.randint(1, 4))
-            permissions = random.choice(["rw", "r", "rwx"])
-            file_size = random.randint(1024, 10485760)  # 1KB to 10MB
-            
             metadata_list.append(FileMetadata(
-                filename=filename,
-                owner=owner,
-                timestamp=timestamp,
-                tags=tags,
-                permissions=permissions,
-                file_size=file_size
+                filename=f"file_{i:05d}{exts[i]}",
+                owner=owners[i],
+                timestamp=stamps[i],
+                tags=tuple(rng.sample(gen.TAGS, k=tag_counts[i])),
+                permissions=permissions[i],
+                file_size=sizes[i],
+                file_id=str(file_ids[i])
             ))
         
         return metadata_list